@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+""" Benchmark harness for lmap against a throwaway slapd
+
+This starts a local slapd the same way test_ldap.py does, fills its database
+with a synthetic directory and measures throughput and latency of the common
+operations. Results are written as JSON so runs from different commits can be
+compared, e.g.:
+
+	./benchmark.py --entries 10000 -o before.json
+	git checkout some-branch
+	./benchmark.py --entries 10000 -o after.json --compare before.json
+
+With --compare, the script exits non-zero if the median latency of any
+operation got worse by more than --threshold.
+"""
+
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from subprocess import *
+import sys, os, time, json, socket, random, platform, argparse
+import os.path as path
+from lmap import ldap
+from lmap.lmap import lmap
+
+BASE_DN = 'ou=bench,ou=pyldap,o=jaseg,c=de'
+ROOT_DN = 'cn=root,'+BASE_DN
+ROOT_PW = 'alpine'
+USER_PW = 'secret'
+# The ldif backend keeps one file per entry and one directory per parent, so
+# beyond this size it mostly measures the file system. Larger directories
+# default to mdb, bulk-loaded with slapadd.
+LDIF_MAX_ENTRIES = 50000
+
+slapd_config = """
+include         {schemadir}/core.schema
+include         {schemadir}/cosine.schema
+include         {schemadir}/nis.schema
+include         {schemadir}/inetorgperson.schema
+
+access to * by * write
+
+{modules}
+database        {backend}
+suffix			"{base}"
+directory       "{dbdir}"
+rootdn			"{rootdn}"
+rootpw			"{rootpw}"
+{extra}
+"""
+
+#Synthetic directory
+def _user(i, attr_size):
+	return {
+		'uid': 'user{}'.format(i),
+		'uidNumber': str(10000+i),
+		'gidNumber': '300',
+		'cn': 'User {}'.format(i),
+		'sn': str(i),
+		'mail': 'user{}@example.com'.format(i),
+		'homeDirectory': '/home/user{}'.format(i),
+		'loginShell': '/bin/sh',
+		'userPassword': USER_PW,
+		'description': ('x'*attr_size) if attr_size else 'Benchmark user',
+		'objectClass': ['inetOrgPerson', 'posixAccount']}
+
+def _group(i, members):
+	return {
+		'cn': 'group{}'.format(i),
+		'gidNumber': str(20000+i),
+		'memberUid': members,
+		'objectClass': ['posixGroup']}
+
+def generate(entries, groups, fanout, attr_size, seed=0):
+	""" Yield (dn, attrs) tuples for a synthetic directory, parents first
+
+	The first objectClass of every entry is its structural object class.
+
+	The directory has ``entries`` users below ou=people and ``groups`` posix
+	groups below ou=groups with ``fanout`` random members each.
+	"""
+	rnd = random.Random(seed)
+	yield BASE_DN, {'ou': 'bench', 'objectClass': ['organizationalUnit']}
+	yield 'ou=people,'+BASE_DN, {'ou': 'people', 'objectClass': ['organizationalUnit']}
+	yield 'ou=groups,'+BASE_DN, {'ou': 'groups', 'objectClass': ['organizationalUnit']}
+	for i in range(entries):
+		yield 'uid=user{},ou=people,{}'.format(i, BASE_DN), _user(i, attr_size)
+	for i in range(groups):
+		members = [ 'user{}'.format(rnd.randrange(entries)) for _ in range(min(fanout, entries)) ]
+		yield 'cn=group{},ou=groups,{}'.format(i, BASE_DN), _group(i, sorted(set(members)))
+
+def _ldif(dn, attrs):
+	lines = ['dn: '+dn]
+	for k, vs in attrs.items():
+		for v in (vs if isinstance(vs, list) else [vs]):
+			lines.append('{}: {}'.format(k, v))
+	return '\n'.join(lines)+'\n\n'
+
+def _ldif_backend_entry(rdn, attrs):
+	""" Render an entry the way slapd's ldif backend stores it
+
+	Unlike slapadd, writing the files directly does not add the operational
+	structuralObjectClass attribute, without which slapd refuses to modify
+	the entry. The generator always lists the structural class first.
+	"""
+	attrs = dict(attrs, structuralObjectClass=attrs['objectClass'][0])
+	return '# FOOBAR\n'+_ldif(rdn, attrs).rstrip('\n')+'\n'
+
+def populate_ldif_backend(dbdir, directory):
+	""" Write entries straight into the file layout of slapd's ldif backend """
+	for dn, attrs in directory:
+		rel = dn[:-len(BASE_DN)].rstrip(',')
+		rdns = rel.split(',') if rel else []
+		parent = path.join(dbdir, BASE_DN, *reversed(rdns[1:])) if rdns else dbdir
+		name = rdns[0] if rdns else BASE_DN
+		os.makedirs(parent, exist_ok=True)
+		with open(path.join(parent, name+'.ldif'), 'w') as f:
+			# The ldif backend stores the rdn only, just like the test fixture does.
+			f.write(_ldif_backend_entry(name.split(',')[0], attrs))
+
+def populate_slapadd(configfile, directory):
+	""" Bulk-load entries with slapadd for the other backends """
+	with NamedTemporaryFile('w') as f:
+		for dn, attrs in directory:
+			f.write(_ldif(dn, attrs))
+		f.flush()
+		check_call(['slapadd', '-q', '-f', configfile, '-l', f.name], stdout=DEVNULL)
+
+def default_backend(entries):
+	return 'ldif' if entries <= LDIF_MAX_ENTRIES else 'mdb'
+
+class slapd:
+	""" A throwaway slapd serving a synthetic directory, to be used as a context manager """
+	def __init__(self, backend=None, schemadir='/etc/openldap/schema', moduledir=None, **gen_args):
+		self.backend = backend or default_backend(gen_args.get('entries', 0))
+		self.schemadir = schemadir
+		self.moduledir = moduledir
+		self.gen_args = gen_args
+
+	def __enter__(self):
+		self.database_dir = TemporaryDirectory()
+		dbdir = self.database_dir.name
+		modules = ''
+		if self.moduledir:
+			modules = 'modulepath {}\nmoduleload back_{}'.format(self.moduledir, self.backend)
+		extra = 'maxsize 17179869184' if self.backend == 'mdb' else ''
+		self.configfile = NamedTemporaryFile()
+		self.configfile.write(bytes(slapd_config.format(schemadir=self.schemadir, modules=modules,
+			backend=self.backend, base=BASE_DN, dbdir=dbdir, rootdn=ROOT_DN, rootpw=ROOT_PW,
+			extra=extra), 'UTF-8'))
+		self.configfile.flush()
+
+		t = time.perf_counter()
+		directory = generate(**self.gen_args)
+		if self.backend == 'ldif':
+			populate_ldif_backend(dbdir, directory)
+		else:
+			populate_slapadd(self.configfile.name, directory)
+		self.populate_time = time.perf_counter()-t
+
+		with socket.socket() as s:
+			s.bind(('127.0.0.1', 0))
+			self.port = s.getsockname()[1]
+		self.uri = 'ldap://127.0.0.1:{}/'.format(self.port)
+		self.process = Popen(['slapd', '-f', self.configfile.name, '-h', self.uri, '-d', 'none'], stdout=DEVNULL, stderr=DEVNULL)
+		for _ in range(100):
+			try:
+				self.connect().close()
+				break
+			except ldap.LDAPError:
+				time.sleep(0.1)
+		else:
+			self.__exit__(None, None, None)
+			raise RuntimeError('slapd did not come up on {}'.format(self.uri))
+		return self
+
+	def __exit__(self, extype, exval, trace):
+		self.process.kill()
+		self.process.wait()
+		self.configfile.close()
+		self.database_dir.cleanup()
+
+	def connect(self):
+		ld = ldap.ldap(self.uri)
+		ld.simple_bind(ROOT_DN, ROOT_PW)
+		return ld
+
+#Measurement
+def _percentile(sorted_values, p):
+	return sorted_values[min(len(sorted_values)-1, int(len(sorted_values)*p))]
+
+def summarize(latencies, items=1):
+	""" Reduce a list of per-call latencies (in seconds) to a statistics dict
+
+	``items`` is the number of entries handled per call and is used to report
+	entry throughput next to call throughput.
+	"""
+	lat = sorted(latencies)
+	total = sum(lat)
+	return {
+		'calls': len(lat),
+		'total': total,
+		'calls_per_sec': len(lat)/total if total else None,
+		'items_per_sec': len(lat)*items/total if total else None,
+		'mean': total/len(lat),
+		'min': lat[0],
+		'median': _percentile(lat, 0.5),
+		'p95': _percentile(lat, 0.95),
+		'p99': _percentile(lat, 0.99),
+		'max': lat[-1]}
+
+def timed(func, repeat, setup=None):
+	""" Call func repeat times and return the list of latencies
+
+	If given, setup is called before each iteration outside of the timed
+	section and its return value is passed to func.
+	"""
+	latencies = []
+	for i in range(repeat):
+		arg = setup(i) if setup else i
+		t = time.perf_counter()
+		func(arg)
+		latencies.append(time.perf_counter()-t)
+	return latencies
+
+def import_time(repeat, module='lmap.lmap'):
+	""" Time importing module in repeat fresh interpreters, excluding interpreter startup """
+	script = 'import time; t = time.perf_counter(); import {}; print(time.perf_counter()-t)'.format(module)
+	root = path.dirname(path.abspath(__file__))
+	return [ float(check_output([sys.executable, '-c', script], cwd=root)) for _ in range(repeat) ]
+
+def run(server, entries, groups, repeat):
+	ld = server.connect()
+	people = 'ou=people,'+BASE_DN
+	user_dn = lambda i: 'uid=user{},{}'.format(i % entries, people)
+	rnd = random.Random(1)
+	results = {}
+
+	def bench(name, func, repeat=repeat, setup=None, items=1):
+		results[name] = summarize(timed(func, repeat, setup), items)
+		print('{:<24} median {:10.6f}s  p99 {:10.6f}s  {:12.1f} items/s'.format(name,
+			results[name]['median'], results[name]['p99'], results[name]['items_per_sec'] or 0), file=sys.stderr)
+
+	# Whole-subtree searches return every entry, so run them less often.
+	heavy = max(1, repeat//100)
+	bench('ldap.search.subtree', lambda _: ld.search(people, ldap.Scope.SUBTREE), heavy, items=entries)
+	bench('ldap.search_iter.subtree', lambda _: sum(1 for _ in ld.search_iter(people, ldap.Scope.SUBTREE)), heavy, items=entries)
+	bench('ldap.search.onelevel.noattrs', lambda _: ld.search(people, ldap.Scope.ONELEVEL, attrs=['1.1']), heavy, items=entries)
+	bench('ldap.search.filter', lambda i: ld.search(people, filter='(uid={})'.format(i)),
+			setup=lambda _: 'user{}'.format(rnd.randrange(entries)))
+	bench('ldap.search.base', lambda dn: ld.search(dn, ldap.Scope.BASE),
+			setup=lambda _: user_dn(rnd.randrange(entries)))
+
+	root = lmap(ldap=ld, dn=people)
+	bench('lmap.search', lambda i: root.search('(uid={})'.format(i)),
+			setup=lambda _: 'user{}'.format(rnd.randrange(entries)))
+	bench('lmap.fetch_children', lambda _: root.fetch_children(), heavy, items=entries)
+
+	def commit_setup(i):
+		entry = lmap(ldap=ld, dn=user_dn(rnd.randrange(entries)))
+		entry.start_transaction()
+		return entry
+	def commit(entry):
+		entry['description'] = 'Modified'
+		entry.commit()
+	bench('lmap.commit', commit, setup=commit_setup)
+
+	if groups:
+		group_dn = lambda i: 'cn=group{},ou=groups,{}'.format(i % groups, BASE_DN)
+		bench('ldap.compare', lambda check: ld.compare(*check),
+				setup=lambda _: (group_dn(rnd.randrange(groups)), 'memberUid', 'user{}'.format(rnd.randrange(entries))))
+		checks = [ (group_dn(rnd.randrange(groups)), 'memberUid', 'user{}'.format(rnd.randrange(entries))) for _ in range(100) ]
+		bench('ldap.compare_many', lambda _: ld.compare_many(checks), heavy, items=len(checks))
+
+	bench('ldap.add', lambda i: ld.add('uid=user{},{}'.format(entries+i, people), _user(entries+i, 0)))
+
+	def bind(_):
+		conn = ldap.ldap(server.uri)
+		conn.simple_bind(user_dn(rnd.randrange(entries)), USER_PW)
+		conn.close()
+	bench('ldap.simple_bind', bind)
+
+	ld.close()
+	return results
+
+#Comparison
+def compare(old, new, threshold):
+	""" Print a comparison of two result sets and return the names of regressed operations """
+	regressions = []
+	for name, res in new['results'].items():
+		if name not in old['results']:
+			continue
+		before, after = old['results'][name]['median'], res['median']
+		change = (after-before)/before if before else 0
+		flag = ''
+		if change > threshold:
+			regressions.append(name)
+			flag = '  REGRESSION'
+		print('{:<24} {:10.6f}s -> {:10.6f}s  {:+7.1%}{}'.format(name, before, after, change, flag))
+	return regressions
+
+def _git_revision():
+	try:
+		return check_output(['git', 'rev-parse', 'HEAD'], cwd=path.dirname(path.abspath(__file__)),
+				stderr=DEVNULL).decode().strip()
+	except (OSError, CalledProcessError):
+		return None
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--entries', type=int, default=10000, help='number of user entries')
+	parser.add_argument('--groups', type=int, default=100, help='number of groups')
+	parser.add_argument('--fanout', type=int, default=50, help='members per group')
+	parser.add_argument('--attr-size', type=int, default=0, help='size of each user\'s description attribute in bytes')
+	parser.add_argument('--repeat', type=int, default=1000, help='calls per cheap operation')
+	parser.add_argument('--import-repeat', type=int, default=20, help='fresh interpreters to time \'import lmap.lmap\' in')
+	parser.add_argument('--backend', help='slapd backend, e.g. ldif or mdb (default: ldif up to {} entries, mdb above)'.format(LDIF_MAX_ENTRIES))
+	parser.add_argument('--schemadir', default='/etc/openldap/schema')
+	parser.add_argument('--moduledir', help='slapd module path, if the backend is built as a module')
+	parser.add_argument('-o', '--output', help='write JSON results to this file instead of stdout')
+	parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+	parser.add_argument('--threshold', type=float, default=0.1, help='tolerated relative median latency increase')
+	args = parser.parse_args()
+
+	args.backend = args.backend or default_backend(args.entries)
+	params = { 'entries': args.entries, 'groups': args.groups, 'fanout': args.fanout, 'attr_size': args.attr_size }
+	with slapd(args.backend, args.schemadir, args.moduledir, **params) as server:
+		print('populated {} entries in {:.1f}s'.format(args.entries, server.populate_time), file=sys.stderr)
+		results = run(server, args.entries, args.groups, args.repeat)
+	# Imports are measured without a server, but reported and compared like any other operation.
+	results['import lmap.lmap'] = summarize(import_time(args.import_repeat))
+	print('{:<24} median {:10.6f}s'.format('import lmap.lmap', results['import lmap.lmap']['median']), file=sys.stderr)
+
+	report = {
+		'meta': dict(params, repeat=args.repeat, import_repeat=args.import_repeat, backend=args.backend, revision=_git_revision(),
+			python=platform.python_version(), platform=platform.platform(), time=time.time()),
+		'results': results}
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(report, f, indent=2)
+	else:
+		json.dump(report, sys.stdout, indent=2)
+
+	if args.compare:
+		with open(args.compare) as f:
+			if compare(json.load(f), report, args.threshold):
+				sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -1 +1 @@
-__all__ = ['lmap', 'ldap']
+__all__ = ['lmap', 'ldap', 'resolver', 'export']
@@ -0,0 +1,132 @@
+
+import csv, json, sys, base64
+import os.path as path
+from array import array
+
+def _lower_keys(attrs):
+	return { k.lower(): v for k, v in attrs.items() }
+
+def _utf8(value):
+	return value if isinstance(value, bytes) else bytes(value, 'UTF-8')
+
+def _csv_value(value, separator):
+	""" Escape a single value for a multi-valued CSV cell, see write_csv """
+	if isinstance(value, bytes):
+		try:
+			value = str(value, 'UTF-8')
+		except UnicodeDecodeError:
+			return ':'+str(base64.b64encode(value), 'ascii')
+	value = value.replace('\\', '\\\\').replace(separator, '\\'+separator)
+	return '\\'+value if value.startswith(':') else value
+
+def write_csv(entries, attrs, f, separator='|'):
+	""" Write (dn, attrs) tuples as CSV rows with one column per attribute
+
+	Multi-valued attributes are joined with ``separator`` into a single cell.
+	Within a cell, backslashes and separators in values are escaped with a
+	backslash. Binary values that are not valid UTF-8 (e.g. from
+	ldap.search_iter(..., raw=True)) are written base64-encoded with a ":"
+	prefix, like LDIF does; text values starting with ":" get a backslash.
+	entries may be any iterable, e.g. ldap.search_iter(...) for constant
+	memory use or ldap.search(...).items(). Returns the number of rows.
+
+	Example:
+	with open('people.csv', 'w', newline='') as f:
+		write_csv(ld.search_iter(base, attrs=['uid', 'mail']), ['uid', 'mail'], f)
+	"""
+	writer = csv.writer(f)
+	writer.writerow(['dn'] + attrs)
+	keys = [ a.lower() for a in attrs ]
+	count = 0
+	for dn, entry in entries:
+		entry = _lower_keys(entry)
+		writer.writerow([dn] + [ separator.join(_csv_value(v, separator) for v in entry.get(k, [])) for k in keys ])
+		count += 1
+	return count
+
+class column:
+	""" A multi-valued string column written to disk in chunks
+
+	A column consists of three files:
+	<name>.offsets			int64, entries+1 items: entry i has the values offsets[i]:offsets[i+1]
+	<name>.value_offsets	int64, values+1 items: value j is data[value_offsets[j]:value_offsets[j+1]]
+	<name>.data				UTF-8 value bytes, concatenated
+
+	This is the layout of Apache Arrow's large_list<large_string> type (plain
+	list<string> uses int32 offsets instead). The files
+	can be loaded with numpy.fromfile(..., dtype='<i8') (or '>i8' on big
+	endian machines, see columns.json) and numpy.fromfile(..., dtype='u1').
+	"""
+	def __init__(self, directory, name):
+		self.name = name
+		self._files = { ext: open(path.join(directory, '{}.{}'.format(name, ext)), 'wb')
+				for ext in ['offsets', 'value_offsets', 'data'] }
+		self.values = 0
+		self.size = 0
+		self._offsets = array('q', [0])
+		self._value_offsets = array('q', [0])
+		self._data = bytearray()
+
+	def append(self, values):
+		for value in values:
+			value = _utf8(value)
+			self._data += value
+			self.size += len(value)
+			self._value_offsets.append(self.size)
+		self.values += len(values)
+		self._offsets.append(self.values)
+
+	def flush(self):
+		self._offsets.tofile(self._files['offsets'])
+		self._value_offsets.tofile(self._files['value_offsets'])
+		self._files['data'].write(self._data)
+		self._offsets = array('q')
+		self._value_offsets = array('q')
+		self._data = bytearray()
+
+	def close(self):
+		self.flush()
+		for f in self._files.values():
+			f.close()
+
+	def manifest(self):
+		return { 'values': self.values, 'bytes': self.size,
+				'files': { ext: '{}.{}'.format(self.name, ext) for ext in self._files } }
+
+def write_columns(entries, attrs, directory, chunk_size=10000):
+	""" Write (dn, attrs) tuples into a columnar on-disk layout in directory
+
+	Every attribute and the dn end up in their own column (see the column
+	class for the file layout), next to a columns.json manifest. Attribute
+	names must be unique ignoring case and must not be "dn". Only
+	``chunk_size`` entries are buffered at a time, so passing
+	ldap.search_iter(..., raw=True) exports arbitrarily large trees in
+	bounded memory without decoding values. Returns the number of entries.
+
+	Example:
+	write_columns(ld.search_iter(base, attrs=['uid', 'memberOf'], raw=True), ['uid', 'memberOf'], 'out/')
+	"""
+	keys = [ a.lower() for a in attrs ]
+	if 'dn' in keys or len(set(keys)) != len(keys):
+		raise ValueError('Attribute names must be unique ignoring case and must not be "dn": {}'.format(attrs))
+	cols = [column(directory, 'dn')] + [ column(directory, a) for a in attrs ]
+	count = 0
+	try:
+		for dn, entry in entries:
+			entry = _lower_keys(entry)
+			cols[0].append([dn])
+			for col, k in zip(cols[1:], keys):
+				col.append(entry.get(k, []))
+			count += 1
+			if count % chunk_size == 0:
+				for col in cols:
+					col.flush()
+	finally:
+		for col in cols:
+			col.close()
+
+	with open(path.join(directory, 'columns.json'), 'w') as f:
+		json.dump({ 'entries': count,
+					'dtype': ('<' if sys.byteorder == 'little' else '>')+'i8',
+					'columns': { col.name: col.manifest() for col in cols } }, f, indent=2)
+	return count
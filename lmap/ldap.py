@@ -1,9 +1,60 @@
 
 from ctypes import *
-import time
 
-libldap = CDLL('libldap.so')
-libldap.ldap_err2string.restype = c_char_p
+# Sonames to try when ctypes.util.find_library does not turn up libldap, e.g.
+# because the unversioned development symlink is not installed.
+LIBLDAP_NAMES = ['libldap.so', 'libldap.so.2', 'libldap-2.5.so.0', 'libldap-2.4.so.2', 'libldap_r-2.4.so.2']
+
+class _libldap_loader:
+	""" Stand-in for the libldap CDLL that loads the library on first use
+
+	Importing this module does not touch the dynamic linker at all. Library
+	discovery and prototype setup happen when the first libldap function is
+	looked up, which usually is ldap.__init__.
+	"""
+	# Return types of the libldap functions not returning an int. Strings we
+	# have to ldap_memfree are returned as c_void_p so we keep the pointer.
+	restypes = {
+		'ldap_err2string':		c_char_p,
+		'ldap_first_entry':		c_void_p,
+		'ldap_next_entry':		c_void_p,
+		'ldap_get_dn':			c_void_p,
+		'ldap_first_attribute':	c_void_p,
+		'ldap_next_attribute':	c_void_p,
+		'ldap_get_values':		POINTER(c_char_p),
+		'ldap_get_values_len':	POINTER(c_void_p)
+	}
+
+	def __init__(self):
+		self._lib = None
+
+	def load(self):
+		if self._lib is None:
+			from ctypes.util import find_library
+			names = LIBLDAP_NAMES
+			found = find_library('ldap')
+			if found:
+				names = [found] + names
+			for name in names:
+				try:
+					lib = CDLL(name)
+					break
+				except OSError:
+					pass
+			else:
+				raise OSError('Cannot find libldap (tried: {})'.format(', '.join(names)))
+			for func, restype in self.restypes.items():
+				getattr(lib, func).restype = restype
+			self._lib = lib
+		return self._lib
+
+	def __getattr__(self, name):
+		func = getattr(self.load(), name)
+		# Cache the function so later lookups do not go through __getattr__
+		setattr(self, name, func)
+		return func
+
+libldap = _libldap_loader()
 
 # Helper stuff
 def _make_c_array(values, type):
@@ -24,6 +75,13 @@ def _libldap_call(func, errmsg, *args):
 		raise LDAPError('{}: {}'.format(errmsg, str(libldap.ldap_err2string(ec), 'UTF-8')))
 	return ec
 
+def _compare_result(ec, errmsg):
+	if ec == LDAP_COMPARE_TRUE:
+		return True
+	if ec in (LDAP_COMPARE_FALSE, LDAP_NO_SUCH_ATTRIBUTE, LDAP_NO_SUCH_OBJECT):
+		return False
+	raise LDAPError('{}: {}'.format(errmsg, str(libldap.ldap_err2string(ec), 'UTF-8')))
+
 def _bytes_or_none(s):
 	return None if s is None else bytes(s, 'UTF-8')
 
@@ -93,7 +151,15 @@ class berval(Structure):
 			self.data = c_char_p(data)
 
 # ldap.h 
+LDAP_COMPARE_FALSE		= 0x05
+LDAP_COMPARE_TRUE		= 0x06
+LDAP_NO_SUCH_ATTRIBUTE	= 0x10
+LDAP_NO_SUCH_OBJECT		= 0x20
 LDAP_OTHER				= 0x50
+LDAP_RES_SEARCH_ENTRY	= 0x64
+LDAP_RES_SEARCH_RESULT	= 0x65
+LDAP_RES_COMPARE		= 0x6f
+LDAP_RES_SEARCH_REFERENCE	= 0x73
 LDAP_SASL_INTERACTIVE	= 1
 LDAP_SASL_QUIET			= 2
 
@@ -210,14 +276,95 @@ class ldap:
 		if ec:
 			raise LDAPError('Could not delete something. For details, please consult your local fortuneteller: {}'.format(str(libldap.ldap_err2string(ec), 'UTF-8')))
 
+	def compare(self, dn, attr, value):
+		""" Ask the server whether the entry at dn has the given attribute value
+
+		Returns a bool. Nothing but the result code is transferred. A missing
+		entry or an entry lacking the attribute altogether compares false, any
+		other error raises an LDAPError.
+		"""
+		bval = berval(bytes(value, 'UTF-8'))
+		ec = libldap.ldap_compare_ext_s(self._ld, bytes(dn, 'UTF-8'), bytes(attr, 'UTF-8'), byref(bval), None, None)
+		return _compare_result(ec, 'Compare operation failed (dn: "{}" attr: "{}")'.format(dn, attr))
+
+	def compare_many(self, checks, timeout=-1):
+		""" Pipelined version of compare
+
+		Takes an iterable of (dn, attr, value) tuples, sends all compare
+		requests before waiting for the first answer and returns a list of
+		bools in the same order.
+		"""
+		msgids = []
+		try:
+			for dn, attr, value in checks:
+				msgid = c_int()
+				bval = berval(bytes(value, 'UTF-8'))
+				_libldap_call(libldap.ldap_compare_ext, 'Cannot send compare request (dn: "{}" attr: "{}")'.format(dn, attr),
+						self._ld, bytes(dn, 'UTF-8'), bytes(attr, 'UTF-8'), byref(bval), None, None, byref(msgid))
+				msgids.append((msgid.value, dn, attr))
+
+			results = []
+			while msgids:
+				msgid, dn, attr = msgids[0]
+				res = c_void_p()
+				rc = libldap.ldap_result(self._ld, msgid, 1, byref(timeval(timeout)) if timeout > 0 else None, byref(res))
+				if rc != LDAP_RES_COMPARE:
+					if rc > 0:
+						libldap.ldap_msgfree(res)
+					raise LDAPError('Did not receive compare result (dn: "{}" attr: "{}")'.format(dn, attr))
+				msgids.pop(0)
+				ec = libldap.ldap_result2error(self._ld, res, 1)
+				results.append(_compare_result(ec, 'Compare operation failed (dn: "{}" attr: "{}")'.format(dn, attr)))
+			return results
+		finally:
+			for msgid, _dn, _attr in msgids:
+				libldap.ldap_abandon_ext(self._ld, msgid, None, None)
+
 	def __call__(self, base, **kwargs):
 		return self.search(base, **kwargs)
 
 	def search(self, base, scope=Scope.SUBTREE, filter=None, attrs=None, timeout=-1):
 		""" Search the remove LDAP tree """
 		results_pointer = c_void_p()
-		#FIXME sizelimit value
-		_libldap_call(libldap.ldap_search_ext_s,
+		try:
+			#FIXME sizelimit value
+			_libldap_call(libldap.ldap_search_ext_s,
+					'Search operation failed (base: "{}" filter: "{}")'.format(base, filter),
+					self._ld,
+					bytes(base, 'UTF-8'),
+					scope,
+					bytes(filter, 'UTF-8') if filter else None,
+					_make_c_attrs(attrs),
+					0,
+					None,
+					None,
+					byref(timeval(timeout)),
+					-1,
+					byref(results_pointer))
+
+			current_msg = cast(libldap.ldap_first_entry(self._ld, results_pointer), c_void_p)
+			py_entries = {}
+			while current_msg:
+				py_dn, py_attrs = self._parse_entry(current_msg)
+				py_entries[py_dn] = py_attrs
+
+				next_msg = cast(libldap.ldap_next_entry(self._ld, current_msg), c_void_p)
+				current_msg = next_msg
+			return py_entries
+		finally:
+			# _parse_entry copies everything out of the message chain, so it can
+			# go. ldap_search_ext_s may return a result even when it fails.
+			libldap.ldap_msgfree(results_pointer)
+
+	def search_iter(self, base, scope=Scope.SUBTREE, filter=None, attrs=None, timeout=-1, raw=False):
+		""" Search the remote LDAP tree, yielding (dn, attrs) tuples as they arrive
+
+		Unlike search, this never holds more than one entry in memory. With
+		``raw=True``, attribute values are returned as undecoded bytes.
+		Closing the generator early abandons the search operation.
+		"""
+		msgid = c_int()
+		_libldap_call(libldap.ldap_search_ext,
 				'Search operation failed (base: "{}" filter: "{}")'.format(base, filter),
 				self._ld,
 				bytes(base, 'UTF-8'),
@@ -229,56 +376,75 @@ class ldap:
 				None,
 				byref(timeval(timeout)),
 				-1,
-				byref(results_pointer))
-
-		libldap.ldap_first_entry.restype = c_void_p
-		current_msg = cast(libldap.ldap_first_entry(self._ld, results_pointer), c_void_p)
-		py_entries = {}
-		while current_msg:
-			libldap.ldap_get_dn.restype = c_char_p
-			c_dn = libldap.ldap_get_dn(self._ld, current_msg)
-			py_dn = str(c_dn, 'UTF-8')
-			#print('HANDLING ENTRY {}'.format(py_dn))
-			#print('freeing dn')
-			#libldap.ldap_memfree(c_dn) FIXME complains that the pointer points to an invalid memory area
-			py_attrs = {}
-
-			current_ber = c_void_p()
-			libldap.ldap_first_attribute.restype = c_char_p
-			current_attr = libldap.ldap_first_attribute(self._ld, current_msg, byref(current_ber))
-			while current_attr:
-				libldap.ldap_get_values.restype = POINTER(c_char_p)
-				values = libldap.ldap_get_values(self._ld, current_msg, current_attr)
-
-				attr_name = str(current_attr, 'UTF-8')
-				py_values = py_attrs.get(attr_name, [])
-
+				byref(msgid))
+
+		done = False
+		try:
+			while True:
+				res = c_void_p()
+				rc = libldap.ldap_result(self._ld, msgid, 0, byref(timeval(timeout)) if timeout > 0 else None, byref(res))
+				if rc == LDAP_RES_SEARCH_ENTRY:
+					try:
+						entry = self._parse_entry(cast(libldap.ldap_first_entry(self._ld, res), c_void_p), raw)
+					finally:
+						libldap.ldap_msgfree(res)
+					yield entry
+				elif rc == LDAP_RES_SEARCH_REFERENCE:
+					libldap.ldap_msgfree(res)
+				elif rc == LDAP_RES_SEARCH_RESULT:
+					done = True
+					_libldap_call(libldap.ldap_result2error,
+							'Search operation failed (base: "{}" filter: "{}")'.format(base, filter),
+							self._ld, res, 1)
+					return
+				else:
+					raise LDAPError('Did not receive search result (base: "{}" filter: "{}")'.format(base, filter))
+		finally:
+			if not done:
+				libldap.ldap_abandon_ext(self._ld, msgid, None, None)
+
+	def _parse_entry(self, msg, raw=False):
+		""" Decode the entry at msg into a (dn, attrs) tuple
+
+		With ``raw=True``, values are read via ldap_get_values_len so binary
+		values containing NUL bytes (jpegPhoto, userCertificate...) survive.
+		"""
+		c_dn = c_void_p(libldap.ldap_get_dn(self._ld, msg))
+		py_dn = str(string_at(c_dn), 'UTF-8')
+		libldap.ldap_memfree(c_dn)
+		py_attrs = {}
+
+		current_ber = c_void_p()
+		current_attr = c_void_p(libldap.ldap_first_attribute(self._ld, msg, byref(current_ber)))
+		while current_attr:
+			attr_name = str(string_at(current_attr), 'UTF-8')
+			py_values = py_attrs.get(attr_name, [])
+
+			if raw:
+				values = libldap.ldap_get_values_len(self._ld, msg, current_attr)
+				if values:
+					i = 0
+					while values[i]:
+						bval = cast(c_void_p(values[i]), POINTER(berval)).contents
+						data = c_void_p.from_buffer(bval, berval.data.offset)
+						py_values.append(string_at(data, bval.len))
+						i = i+1
+				libldap.ldap_value_free_len(values)
+			else:
+				values = libldap.ldap_get_values(self._ld, msg, current_attr)
 				if values:
 					i = 0
 					while values[i]:
 						py_values.append(str(values[i], 'UTF-8'))
 						i = i+1
-
-				py_attrs[attr_name] = py_values
-
 				libldap.ldap_value_free(values)
 
-				#print('freeing current attribute')
-				#libldap.ldap_memfree(current_attr) FIXME makes some assert() fail
-				libldap.ldap_next_attribute.restype = c_char_p
-				next_attr = libldap.ldap_next_attribute(self._ld, current_msg, current_ber)
-				current_attr = next_attr
-			libldap.ber_free(current_ber)
-
-			py_entries[py_dn] = py_attrs
-
-			libldap.ldap_next_entry.restype = c_void_p
-			next_msg = cast(libldap.ldap_next_entry(self._ld, current_msg), c_void_p)
-			current_msg = next_msg
+			py_attrs[attr_name] = py_values
 
-		#print('freeing message')
-		#libldap.ldap_msgfree(results_pointer) FIXME segfaults
-		return py_entries
+			libldap.ldap_memfree(current_attr)
+			current_attr = c_void_p(libldap.ldap_next_attribute(self._ld, msg, current_ber))
+		libldap.ber_free(current_ber, 0)
+		return py_dn, py_attrs
 
 class LDAPError(Exception):
 	pass
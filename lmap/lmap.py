@@ -1,5 +1,4 @@
 
-import itertools, copy
 from lmap import ldap
 
 # do a diff between two dicts and output the results as a modlist
@@ -40,6 +39,8 @@ class lmap(dict):
 			self.commit()
 
 	def start_transaction(self):
+		# Imported here to keep 'import lmap' cheap for short-lived scripts that never modify anything
+		import copy
 		self._rollback_state = copy.deepcopy(self.attrs)
 
 	def rollback(self):
@@ -59,6 +60,14 @@ class lmap(dict):
 		except ldap.LDAPError:
 			return {}
 	
+	def has_value(self, attr, value):
+		""" Check for an attribute value on the server without fetching the entry """
+		return self._ldap.compare(self.dn, attr, value)
+
+	def has_values(self, checks):
+		""" Batched has_value taking a list of (attr, value) tuples, returns a list of bools """
+		return self._ldap.compare_many([ (self.dn, attr, value) for attr, value in checks ], timeout=self.timeout)
+	
 	def __setitem__(self, name, value):
 		#FIXME prevent self['dn'] and self.dn from getting out of sync?
 		self.attrs[name] = value
@@ -118,7 +127,7 @@ class lmap(dict):
 		return rv
 
 	def __dir__(self):
-		return list(itertools.chain(self.__dict__.keys(), iter(self.children)))
+		return list(self.__dict__.keys()) + list(self.children)
 	
 	def replace(self, childname, newchild):
 		pass #FIXME
@@ -0,0 +1,187 @@
+
+import threading
+from collections import OrderedDict
+from lmap import ldap
+
+def _escape_filter_value(value):
+	""" Escape a value for use in an LDAP search filter (RFC 4515) """
+	return ''.join('\\{:02x}'.format(ord(c)) if c in '*()\\\0' else c for c in value)
+
+def _split_unescaped(s, sep):
+	""" Split s at every sep not preceded by a backslash escape """
+	parts, current, escaped = [], '', False
+	for c in s:
+		if escaped:
+			current += c
+			escaped = False
+		elif c == '\\':
+			current += c
+			escaped = True
+		elif c == sep:
+			parts.append(current)
+			current = ''
+		else:
+			current += c
+	parts.append(current)
+	return parts
+
+def normalize_dn(dn):
+	""" Normalize a DN for comparison
+
+	Strips insignificant whitespace around separators, lowercases attribute
+	types and values (all attributes used in our DNs match case-insensitively)
+	and sorts the parts of multi-valued RDNs. Values without any "=" such as
+	memberUid entries are just stripped and lowercased.
+	"""
+	if '=' not in dn:
+		return dn.strip().lower()
+	rdns = []
+	for rdn in _split_unescaped(dn, ','):
+		avas = []
+		for ava in _split_unescaped(rdn, '+'):
+			type, _, value = ava.partition('=')
+			avas.append('{}={}'.format(type.strip().lower(), value.strip().lower()))
+		rdns.append('+'.join(sorted(avas)))
+	return ','.join(rdns)
+
+class resolver:
+	""" Transitive group membership resolver
+
+	Expands member/uniqueMember/memberUid graphs breadth-first, fetching each
+	level of the graph with a single OR-filter search (split into chunks of
+	``batch_size`` terms) instead of one search per group. Cycles are detected
+	and simply not followed again.
+
+	Expanded groups are kept in a bounded LRU cache of ``cache_size`` entries.
+	Call ``invalidate(dn)`` after modifying a group; this drops every cached
+	expansion that went through it. ``invalidate()`` clears the whole cache.
+
+	Groups are looked up by their DN through ``dn_attr``, which defaults to
+	OpenLDAP's entryDN. Use e.g. distinguishedName for Active Directory.
+
+	Example:
+	r = resolver(ld, 'ou=groups,dc=example,dc=com')
+	r.members('cn=admins,ou=groups,dc=example,dc=com') # frozenset of user DNs and uids
+	r.is_member('cn=admins,ou=groups,dc=example,dc=com', 'fnord')
+	"""
+	# Entries of these object classes count as groups even when they have no members
+	group_classes = {'groupofnames', 'groupofuniquenames', 'posixgroup', 'groupofmembers', 'group'}
+
+	def __init__(self, ldap, base, attrs=('member', 'uniqueMember', 'memberUid'), dn_attr='entryDN',
+			cache_size=1024, batch_size=500, timeout=-1):
+		self._ldap = ldap
+		self.base = base
+		self.attrs = list(attrs)
+		self._member_attrs = { a.lower() for a in attrs }
+		self.dn_attr = dn_attr
+		self.cache_size = cache_size
+		self.batch_size = batch_size
+		self.timeout = timeout
+		# normalized group dn -> (members, normalized members, normalized dns of all groups traversed)
+		self._cache = OrderedDict()
+		self._lock = threading.Lock()
+
+	def _cached(self, key):
+		with self._lock:
+			entry = self._cache.get(key)
+			if entry is not None:
+				self._cache.move_to_end(key)
+			return entry
+
+	def _store(self, key, entry):
+		with self._lock:
+			self._cache[key] = entry
+			self._cache.move_to_end(key)
+			while len(self._cache) > self.cache_size:
+				self._cache.popitem(last=False)
+
+	def invalidate(self, dn=None):
+		""" Forget the expansion of every cached group that contains dn, or everything if dn is None """
+		with self._lock:
+			if dn is None:
+				self._cache.clear()
+				return
+			key = normalize_dn(dn)
+			for k in [ k for k, (_, _, groups) in self._cache.items() if k == key or key in groups ]:
+				del self._cache[k]
+
+	def _fetch(self, dns):
+		""" Fetch the member attributes of the given DNs, returns a dict normalized dn -> attrs """
+		rv = {}
+		for i in range(0, len(dns), self.batch_size):
+			chunk = dns[i:i+self.batch_size]
+			filter = '(|{})'.format(''.join('({}={})'.format(self.dn_attr, _escape_filter_value(dn)) for dn in chunk))
+			res = self._ldap.search(self.base, ldap.Scope.SUBTREE, filter=filter, attrs=self.attrs+['objectClass'], timeout=self.timeout)
+			rv.update((normalize_dn(dn), attrs) for dn, attrs in res.items())
+		return rv
+
+	def _is_group(self, attrs):
+		classes = { c.lower() for c in attrs.get('objectClass', []) }
+		return bool(classes & self.group_classes) or any(k.lower() in self._member_attrs for k in attrs)
+
+	def _expand(self, dn):
+		root = normalize_dn(dn)
+		members, groups = set(), set()
+		seen = {root}
+		frontier = [dn]
+		while frontier:
+			fetched = self._fetch(frontier)
+			candidates = {}
+			for d in frontier:
+				key = normalize_dn(d)
+				attrs = fetched.get(key)
+				if attrs is None or not self._is_group(attrs):
+					# A plain member, or something outside our base we cannot look into
+					if key != root:
+						members.add(d)
+					continue
+				groups.add(key)
+				for attr, values in attrs.items():
+					attr = attr.lower()
+					if attr == 'memberuid':
+						members.update(values)
+					elif attr in self._member_attrs:
+						for value in values:
+							# uniqueMember values may carry an optional "#'...'B" uid suffix
+							member = value.split('#')[0] if attr == 'uniquemember' else value
+							key = normalize_dn(member)
+							if key in seen:
+								continue # cycle or already reached via another path
+							seen.add(key)
+							cached = self._cached(key)
+							if cached is None:
+								candidates[key] = member
+							else:
+								members.update(cached[0])
+								groups.update(cached[2])
+								seen.update(cached[2])
+			frontier = list(candidates.values())
+		return members, groups
+
+	def members(self, dn):
+		""" Return a frozenset of all direct and indirect non-group members of the group at dn
+
+		Members referenced via member/uniqueMember are returned as DNs, those
+		referenced via memberUid as uids.
+		"""
+		return self._resolve(dn)[0]
+
+	def _resolve(self, dn):
+		key = normalize_dn(dn)
+		entry = self._cached(key)
+		if entry is None:
+			members, groups = self._expand(dn)
+			entry = (frozenset(members), frozenset(normalize_dn(m) for m in members), frozenset(groups))
+			# Only cache real groups. Expansions look up every member DN in the
+			# cache, so an entry for a plain member would make it vanish.
+			if groups:
+				self._store(key, entry)
+		return entry
+
+	def is_member(self, dn, member):
+		""" Check whether member (a DN or uid) is a direct or indirect member of the group at dn """
+		return normalize_dn(member) in self._resolve(dn)[1]
+
+	def groups(self, dn):
+		""" Return a frozenset of the normalized DNs of dn and all its nested subgroups """
+		return self._resolve(dn)[2]
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, mock, main
+from lmap.ldap import ldap, LDAPError, _compare_result
+from lmap.lmap import lmap
+
+GROUP_DN = 'cn=admins,ou=groups,ou=test,ou=pyldap,o=jaseg,c=de'
+
+class CompareTest(TestCase):
+	def setUp(self):
+		self.ldap = mock.Mock(spec=ldap)
+		self.lmap = lmap(ldap=self.ldap, dn=GROUP_DN)
+
+	def testHasValue(self):
+		""" Check an attribute value via compare instead of fetching the entry """
+		self.ldap.compare.return_value = True
+		self.assertTrue(self.lmap.has_value('memberUid', 'fnord'))
+		self.ldap.compare.assert_called_with(GROUP_DN, 'memberUid', 'fnord')
+		self.ldap.search.assert_not_called()
+
+	def testHasValues(self):
+		""" Batched checks are passed on as one pipelined compare_many call """
+		self.ldap.compare_many.return_value = [True, False]
+		self.assertEqual(self.lmap.has_values([('memberUid', 'fnord'), ('memberUid', 'hacker')]), [True, False])
+		self.ldap.compare_many.assert_called_once_with(
+				[(GROUP_DN, 'memberUid', 'fnord'), (GROUP_DN, 'memberUid', 'hacker')], timeout=-1)
+		self.ldap.search.assert_not_called()
+
+	def testErrorsPropagate(self):
+		""" Errors other than a missing entry or attribute are not mistaken for a negative answer """
+		self.ldap.compare.side_effect = LDAPError("Can't contact LDAP server")
+		with self.assertRaises(LDAPError):
+			self.lmap.has_value('memberUid', 'fnord')
+		self.ldap.compare_many.side_effect = LDAPError("Can't contact LDAP server")
+		with self.assertRaises(LDAPError):
+			self.lmap.has_values([('memberUid', 'fnord')])
+
+	def testCompareResult(self):
+		""" A missing entry or attribute compares false instead of failing a whole batch """
+		self.assertTrue(_compare_result(0x06, ''))
+		for ec in [0x05, 0x10, 0x20]:
+			self.assertFalse(_compare_result(ec, ''))
+
+if __name__ == '__main__':
+	main()
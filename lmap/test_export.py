@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+import io, os, json
+from array import array
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+from lmap.export import write_csv, write_columns
+
+entries = [
+	('uid=fnord,ou=test', {'uid': ['fnord'], 'objectClass': ['inetOrgPerson', 'posixAccount']}),
+	('uid=hacker,ou=test', {'uid': [b'hacker'], 'objectclass': [b'inetOrgPerson']}),
+	('ou=test', {'ou': ['test']})]
+
+class ExportTest(TestCase):
+	def testCsv(self):
+		f = io.StringIO()
+		self.assertEqual(write_csv(iter(entries), ['uid', 'objectClass'], f), 3)
+		self.assertEqual(f.getvalue().splitlines(), [
+			'dn,uid,objectClass',
+			'"uid=fnord,ou=test",fnord,inetOrgPerson|posixAccount',
+			'"uid=hacker,ou=test",hacker,inetOrgPerson',
+			'ou=test,,'])
+
+	def testCsvEscaping(self):
+		""" Separators, backslashes and binary values stay distinguishable within a cell """
+		f = io.StringIO()
+		write_csv([('cn=x', {'description': ['a|b', 'c\\d', ':e'], 'jpegPhoto': [b'\xff\xd8\x00']})],
+				['description', 'jpegPhoto'], f)
+		self.assertEqual(f.getvalue().splitlines()[1], 'cn=x,a\\|b|c\\\\d|\\:e,:/9gA')
+
+	def testColumns(self):
+		with TemporaryDirectory() as d:
+			self.assertEqual(write_columns(iter(entries), ['uid', 'objectClass'], d, chunk_size=2), 3)
+			with open(os.path.join(d, 'columns.json')) as f:
+				manifest = json.load(f)
+			self.assertEqual(manifest['entries'], 3)
+			self.assertEqual(manifest['columns']['objectClass']['values'], 3)
+
+			def load(name, ext, typecode='q'):
+				with open(os.path.join(d, '{}.{}'.format(name, ext)), 'rb') as f:
+					return list(array(typecode, f.read())) if typecode else f.read()
+			self.assertEqual(load('objectClass', 'offsets'), [0, 2, 3, 3])
+			self.assertEqual(load('objectClass', 'value_offsets'), [0, 13, 25, 38])
+			self.assertEqual(load('objectClass', 'data', None), b'inetOrgPersonposixAccountinetOrgPerson')
+			self.assertEqual(load('dn', 'offsets'), [0, 1, 2, 3])
+
+	def testColumnNameClash(self):
+		""" Attributes that would overwrite each other's (or the dn's) files are rejected """
+		with TemporaryDirectory() as d:
+			for attrs in [['uid', 'dn'], ['objectClass', 'objectclass']]:
+				with self.assertRaises(ValueError):
+					write_columns(iter(entries), attrs, d)
+			self.assertEqual(os.listdir(d), [])
+
+if __name__ == '__main__':
+	main()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-from unittest import TestCase, main
+from unittest import TestCase, mock, main
 from tempfile import NamedTemporaryFile, TemporaryDirectory
 from subprocess import *
 import sys,os,time
@@ -80,6 +80,89 @@ py_test_object = {
 	'description': 'Test user',
 	'objectClass': ['inetOrgPerson', 'posixAccount']}
 
+class ImportTest(TestCase):
+	def testLazyImport(self):
+		""" Importing the package must neither load libldap nor pull in ctypes.util (timing is left to benchmark.py) """
+		script = ('import sys, lmap.lmap; print(lmap.ldap.libldap._lib is None, "ctypes.util" in sys.modules,'
+				  '"copy" in sys.modules)')
+		root = path.dirname(path.dirname(path.abspath(__file__)))
+		self.assertEqual(check_output([sys.executable, '-c', script], cwd=root).split(), [b'True', b'False', b'False'])
+
+	def testSonameFallback(self):
+		""" Without find_library's help, the versioned sonames are tried in order """
+		tried = []
+		def fake_cdll(name):
+			tried.append(name)
+			if name != ldap.LIBLDAP_NAMES[-1]:
+				raise OSError(name)
+			return mock.MagicMock()
+		with mock.patch('ctypes.util.find_library', return_value=None), mock.patch.object(ldap, 'CDLL', fake_cdll):
+			loader = ldap._libldap_loader()
+			lib = loader.load()
+		self.assertEqual(tried, ldap.LIBLDAP_NAMES)
+		self.assertIs(loader.ldap_initialize, lib.ldap_initialize)
+
+	def testFindLibraryPreferred(self):
+		with mock.patch('ctypes.util.find_library', return_value='libldap-9.9.so.0'), \
+				mock.patch.object(ldap, 'CDLL', side_effect=OSError):
+			with self.assertRaises(OSError) as cm:
+				ldap._libldap_loader().load()
+		self.assertIn('libldap-9.9.so.0, '+ldap.LIBLDAP_NAMES[0], str(cm.exception))
+
+class ParseEntryTest(TestCase):
+	""" Feed _parse_entry C buffers we own through a fake libldap """
+	def setUp(self):
+		self.buffers = { name: ldap.create_string_buffer(bytes(name, 'UTF-8')) for name in ['uid=fnord', 'jpegPhoto', 'uid'] }
+		self.photo = ldap.berval(b'\xff\xd8\x00\x10JFIF')
+		attrs = iter([self.buffers['uid'], None])
+		self.freed = []
+		self.lib = mock.Mock()
+		self.lib.ldap_get_dn.return_value = ldap.addressof(self.buffers['uid=fnord'])
+		self.lib.ldap_first_attribute.return_value = ldap.addressof(self.buffers['jpegPhoto'])
+		self.lib.ldap_next_attribute.side_effect = lambda *args: (lambda b: b and ldap.addressof(b))(next(attrs))
+		self.lib.ldap_get_values_len.return_value = ldap.cast((ldap.c_void_p * 2)(ldap.addressof(self.photo), None), ldap.POINTER(ldap.c_void_p))
+		self.lib.ldap_get_values.return_value = ldap.cast((ldap.c_char_p * 2)(b'fnord', None), ldap.POINTER(ldap.c_char_p))
+		self.lib.ldap_memfree.side_effect = lambda p: self.freed.append(ldap.string_at(p))
+		self.conn = ldap.ldap.__new__(ldap.ldap)
+		self.conn._ld = None
+
+	def testRawValuesKeepNulBytes(self):
+		with mock.patch.object(ldap, 'libldap', self.lib):
+			dn, attrs = self.conn._parse_entry(None, raw=True)
+		self.assertEqual(dn, 'uid=fnord')
+		self.assertEqual(attrs['jpegPhoto'], [b'\xff\xd8\x00\x10JFIF'])
+		self.assertTrue(self.lib.ldap_value_free_len.called)
+
+	def testStringsAreFreed(self):
+		with mock.patch.object(ldap, 'libldap', self.lib):
+			dn, attrs = self.conn._parse_entry(None)
+		self.assertEqual(attrs, {'jpegPhoto': ['fnord'], 'uid': ['fnord']})
+		self.assertEqual(self.freed, [b'uid=fnord', b'jpegPhoto', b'uid'])
+		self.assertEqual(self.lib.ber_free.call_args[0][1], 0)
+
+class SearchFreeTest(TestCase):
+	def testResultChainFreed(self):
+		""" search frees the result message chain, also when the search fails """
+		lib = mock.Mock()
+		def search_ext_s(*args):
+			args[-1]._obj.value = 0x1234
+			return lib.search_rc
+		lib.ldap_search_ext_s.side_effect = search_ext_s
+		lib.ldap_first_entry.return_value = None
+		lib.ldap_err2string.return_value = b'Operations error'
+		conn = ldap.ldap.__new__(ldap.ldap)
+		conn._ld = None
+		for rc in [0, 1]:
+			lib.search_rc = rc
+			lib.ldap_msgfree.reset_mock()
+			with mock.patch.object(ldap, 'libldap', lib):
+				if rc:
+					with self.assertRaises(ldap.LDAPError):
+						conn.search(BASE_DN)
+				else:
+					self.assertEqual(conn.search(BASE_DN), {})
+			self.assertEqual(lib.ldap_msgfree.call_args[0][0].value, 0x1234)
+
 class SlapdLdapTest(TestCase):
 	def setUp(self):
 		# FIXME somehow check this port number for availability
@@ -123,6 +206,12 @@ class SlapdLdapTest(TestCase):
 			self.assertIn(a, res[k])
 			self.assertEqual(res[k][a], v)
 
+	def testSearchIter(self):
+		res = dict(self.ldap.search_iter(BASE_DN))
+		self.assertEqual(res, self.ldap(BASE_DN))
+		raw = dict(self.ldap.search_iter(BASE_DN, filter='uid=fnord', attrs=['uid'], raw=True))
+		self.assertEqual(raw, {'uid=fnord,'+BASE_DN: {'uid': [b'fnord']}})
+
 	def testAdd(self):
 		self.ldap.add(py_test_object['dn'], py_test_object)
 		with open(os.path.join(self.database_dir.name, BASE_DN, 'uid=guest.ldif')) as f:
@@ -154,6 +243,19 @@ class SlapdLdapTest(TestCase):
 				for v in vs:
 					self.assertIn('{}: {}\n'.format(k, v), db_lines)
 
+	def testCompare(self):
+		self.assertTrue(self.ldap.compare('uid=fnord,'+BASE_DN, 'uidNumber', '3737'))
+		self.assertFalse(self.ldap.compare('uid=fnord,'+BASE_DN, 'uidNumber', '2342'))
+		self.assertFalse(self.ldap.compare('uid=fnord,'+BASE_DN, 'memberUid', 'fnord'))
+		self.assertFalse(self.ldap.compare('uid=nobody,'+BASE_DN, 'uid', 'nobody'))
+
+	def testCompareMany(self):
+		checks = [('uid=fnord,'+BASE_DN, 'uid', 'fnord'),
+				  ('uid=hacker,'+BASE_DN, 'uid', 'fnord'),
+				  ('uid=hacker,'+BASE_DN, 'uidNumber', '2342'),
+				  ('uid=nobody,'+BASE_DN, 'uid', 'nobody')]
+		self.assertEqual(self.ldap.compare_many(checks), [True, False, True, False])
+
 if __name__ == '__main__':
 	main()
 
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import re
+from unittest import TestCase, mock, main
+from lmap.ldap import ldap
+from lmap.resolver import resolver, normalize_dn
+
+BASE_DN = 'ou=groups,ou=test,ou=pyldap,o=jaseg,c=de'
+
+def group(name):
+	return 'cn={},{}'.format(name, BASE_DN)
+
+directory = {
+	group('admins'): {'objectClass': ['groupOfNames'], 'member': [group('wheel'), 'uid=fnord,ou=people']},
+	group('wheel'): {'objectClass': ['groupOfNames'], 'member': [group('staff'), 'uid=hacker,ou=people']},
+	# staff and wheel contain each other
+	group('staff'): {'objectClass': ['groupOfNames'], 'member': [group('wheel'), group('posix')]},
+	group('posix'): {'objectClass': ['posixGroup'], 'memberUid': ['guest']},
+	group('empty'): {'objectClass': ['groupOfNames']},
+	'uid=fnord,ou=people': {},
+	'uid=hacker,ou=people': {}}
+
+def fake_search(base, scope, filter, attrs, timeout):
+	dns = re.findall(r'\(entryDN=([^)]*)\)', filter)
+	return { dn: directory[dn] for dn in dns if dn in directory }
+
+class ResolverTest(TestCase):
+	def setUp(self):
+		self.ldap = mock.Mock(spec=ldap)
+		self.ldap.search.side_effect = fake_search
+		self.resolver = resolver(self.ldap, BASE_DN, cache_size=2)
+
+	def testMembers(self):
+		""" Nested members are resolved with one search per nesting level despite the wheel/staff cycle """
+		self.assertEqual(self.resolver.members(group('admins')),
+				{'uid=fnord,ou=people', 'uid=hacker,ou=people', 'guest'})
+		self.assertEqual(self.ldap.search.call_count, 4)
+		self.assertEqual(self.resolver.members(group('empty')), set())
+
+	def testIsMember(self):
+		self.assertTrue(self.resolver.is_member(group('admins'), 'GUEST'))
+		self.assertTrue(self.resolver.is_member(group('wheel'), 'uid=hacker,ou=people'))
+		self.assertFalse(self.resolver.is_member(group('posix'), 'uid=hacker,ou=people'))
+
+	def testCache(self):
+		""" Expanded groups are cached, reused for supergroups and dropped on invalidation """
+		self.resolver.members(group('wheel'))
+		self.ldap.search.reset_mock()
+		self.resolver.members(group('wheel'))
+		self.ldap.search.assert_not_called()
+		self.assertEqual(self.resolver.members(group('admins')),
+				{'uid=fnord,ou=people', 'uid=hacker,ou=people', 'guest'})
+		# admins itself and its direct user member, wheel comes from the cache
+		self.assertEqual(self.ldap.search.call_count, 2)
+
+		self.resolver.invalidate(group('posix'))
+		self.ldap.search.reset_mock()
+		self.resolver.members(group('wheel'))
+		self.assertTrue(self.ldap.search.called)
+
+	def testNonGroupNotCached(self):
+		""" Asking about a plain member must not make it disappear from later expansions """
+		self.assertFalse(self.resolver.is_member('uid=fnord,ou=people', 'x'))
+		self.assertEqual(self.resolver.members(group('admins')),
+				{'uid=fnord,ou=people', 'uid=hacker,ou=people', 'guest'})
+
+	def testInvalidateSelf(self):
+		""" Invalidating a group drops its own cached expansion """
+		self.resolver.members(group('posix'))
+		self.resolver.invalidate(group('posix'))
+		self.assertEqual(len(self.resolver._cache), 0)
+
+	def testDnSpacing(self):
+		""" Member values spelled differently from the server's DN still resolve as groups """
+		directory[group('spaced')] = {'objectClass': ['groupOfNames'],
+				'member': ['CN=wheel, ou=groups , ou=test,ou=pyldap,o=jaseg,c=de', 'uid=fnord,ou=people']}
+		def search(base, scope, filter, attrs, timeout):
+			# Like a real server, match DNs semantically and return them in their stored form
+			dns = { normalize_dn(dn) for dn in re.findall(r'\(entryDN=([^)]*)\)', filter) }
+			return { dn: attrs for dn, attrs in directory.items() if normalize_dn(dn) in dns }
+		self.ldap.search.side_effect = search
+		try:
+			self.assertEqual(self.resolver.members(group('spaced')),
+					{'uid=fnord,ou=people', 'uid=hacker,ou=people', 'guest'})
+			self.assertTrue(self.resolver.is_member(group('spaced'), 'uid=Hacker, ou=people'))
+			self.assertIn(normalize_dn(group('wheel')), self.resolver.groups(group('spaced')))
+		finally:
+			del directory[group('spaced')]
+
+	def testNormalizeDn(self):
+		self.assertEqual(normalize_dn(' CN = Wheel , ou=Groups+cn=x,o=a\\,b'), 'cn=wheel,cn=x+ou=groups,o=a\\,b')
+		self.assertEqual(normalize_dn(' Guest '), 'guest')
+
+	def testCacheBound(self):
+		for name in ['admins', 'wheel', 'staff', 'posix']:
+			self.resolver.members(group(name))
+		self.assertEqual(len(self.resolver._cache), 2)
+
+if __name__ == '__main__':
+	main()
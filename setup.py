@@ -10,7 +10,7 @@ def read(filename):
 #This is a list of files to install, and where
 #(relative to the 'root' dir, where setup.py is)
 #You could be more specific.
-files = ["lmap/ldap.py", "lmap/lmap.py"]
+files = ["lmap/ldap.py", "lmap/lmap.py", "lmap/resolver.py", "lmap/export.py"]
 
 setup(name = "lmap",
     version = ver,
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import io, os
+from tempfile import TemporaryDirectory
+from contextlib import redirect_stdout
+from unittest import TestCase, main
+import benchmark
+
+class BenchmarkHelperTest(TestCase):
+	def testGenerate(self):
+		entries = list(benchmark.generate(entries=10, groups=3, fanout=4, attr_size=16))
+		self.assertEqual(len(entries), 3+10+3)
+		self.assertEqual(entries[0][0], benchmark.BASE_DN)
+		dns = [ dn for dn, _ in entries ]
+		self.assertEqual(len(set(dns)), len(dns))
+		users = { attrs['uid'] for dn, attrs in entries if dn.startswith('uid=') }
+		for dn, attrs in entries:
+			if dn.startswith('uid='):
+				self.assertEqual(len(attrs['description']), 16)
+			if dn.startswith('cn=group'):
+				self.assertTrue(0 < len(attrs['memberUid']) <= 4)
+				self.assertTrue(set(attrs['memberUid']) <= users)
+		# Generation is seeded and thus reproducible
+		self.assertEqual(entries, list(benchmark.generate(entries=10, groups=3, fanout=4, attr_size=16)))
+
+	def testLdifBackendEntries(self):
+		""" Directly written entries carry structuralObjectClass, or slapd refuses to modify them """
+		expected = {'ou=bench': 'organizationalUnit', 'uid=user0': 'inetOrgPerson', 'cn=group0': 'posixGroup'}
+		for dn, attrs in benchmark.generate(entries=1, groups=1, fanout=1, attr_size=0):
+			rdn = dn.split(',')[0]
+			text = benchmark._ldif_backend_entry(rdn, attrs)
+			lines = text.splitlines()
+			self.assertEqual(lines[0], '# FOOBAR')
+			self.assertEqual(lines[1], 'dn: '+rdn)
+			if rdn in expected:
+				self.assertIn('structuralObjectClass: '+expected[rdn], lines)
+			self.assertEqual(sum(l.startswith('structuralObjectClass: ') for l in lines), 1)
+
+	def testPopulateLdifBackend(self):
+		with TemporaryDirectory() as d:
+			benchmark.populate_ldif_backend(d, benchmark.generate(entries=2, groups=1, fanout=1, attr_size=0))
+			with open(os.path.join(d, benchmark.BASE_DN, 'ou=people', 'uid=user1.ldif')) as f:
+				self.assertIn('structuralObjectClass: inetOrgPerson\n', f.read())
+
+	def testSummarize(self):
+		stats = benchmark.summarize([ i/100 for i in range(100, 0, -1) ], items=10)
+		self.assertEqual(stats['calls'], 100)
+		self.assertAlmostEqual(stats['total'], 50.5)
+		self.assertAlmostEqual(stats['calls_per_sec'], 100/50.5)
+		self.assertAlmostEqual(stats['items_per_sec'], 1000/50.5)
+		self.assertEqual((stats['min'], stats['max']), (0.01, 1.0))
+		self.assertEqual((stats['median'], stats['p95'], stats['p99']), (0.51, 0.96, 1.0))
+
+	def testCompare(self):
+		old = {'results': {'a': {'median': 1.0}, 'b': {'median': 1.0}, 'gone': {'median': 1.0}}}
+		new = {'results': {'a': {'median': 1.05}, 'b': {'median': 1.5}, 'new': {'median': 1.0}}}
+		with redirect_stdout(io.StringIO()):
+			self.assertEqual(benchmark.compare(old, new, 0.1), ['b'])
+			self.assertEqual(benchmark.compare(old, new, 0.01), ['a', 'b'])
+			self.assertEqual(benchmark.compare(new, old, 0.1), [])
+
+	def testImportTime(self):
+		times = benchmark.import_time(2)
+		self.assertEqual(len(times), 2)
+		self.assertTrue(all(0 < t < 10 for t in times))
+
+	def testDefaultBackend(self):
+		self.assertEqual(benchmark.default_backend(10000), 'ldif')
+		self.assertEqual(benchmark.default_backend(1000000), 'mdb')
+
+if __name__ == '__main__':
+	main()